@@ -1,7 +1,10 @@
 import ast
+import functools
 import os
+import stat
+from collections import deque
 
-from PyQt5.QtCore import Qt, QSettings
+from PyQt5.QtCore import Qt, QSettings, QTimer, pyqtSignal
 from PyQt5.QtGui import QIcon, QGuiApplication, QKeySequence, QDragEnterEvent, QDropEvent
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QFileDialog, QVBoxLayout, QPushButton, QTextEdit,
@@ -13,11 +16,22 @@ from PyQt5.QtWidgets import (
 
 ICON_PATH = 'assets/icon/FileKitty-icon.png'
 
+# Markdown code fence language for each non-Python file extension
+LANGUAGES_BY_EXTENSION = {
+    '.js': 'javascript',
+    '.ts': 'typescript',
+    '.tsx': 'typescript',
+}
+
+# Fields that hold statement lists (or except handlers / match cases that do), in node._fields order
+_STATEMENT_FIELDS = ('body', 'handlers', 'orelse', 'finalbody', 'cases')
+
 
 class PreferencesDialog(QDialog):
     def __init__(self, parent=None):
         super(PreferencesDialog, self).__init__(parent)
         self.setWindowTitle('Preferences')
+        self.settings = app_settings()
         self.initUI()
 
     def initUI(self):
@@ -55,8 +69,7 @@ class PreferencesDialog(QDialog):
         self.pathEdit.setText(path)
 
     def accept(self):
-        settings = QSettings('YourCompany', 'FileKitty')
-        settings.setValue('defaultPath', self.get_path())
+        self.settings.setValue('defaultPath', self.get_path())
         super().accept()
 
 
@@ -67,6 +80,7 @@ class SelectClassesFunctionsDialog(QDialog):
         self.all_classes = all_classes
         self.all_functions = all_functions
         self.selected_items = selected_items if selected_items is not None else []
+        self._preselected = frozenset(self.selected_items)
         self.resize(600, 400)  # Set width to 600px and height to 400px
         self.initUI()
 
@@ -74,23 +88,20 @@ class SelectClassesFunctionsDialog(QDialog):
         layout = QVBoxLayout(self)
 
         self.fileList = QListWidget(self)
+        self.checkableItems = []  # Symbol rows only; file headers are never checkable
         for file_path, classes in self.all_classes.items():
             file_header = QListWidgetItem(f"File: {os.path.basename(file_path)} (Classes)")
             file_header.setFlags(file_header.flags() & ~Qt.ItemIsSelectable)
             self.fileList.addItem(file_header)
             for cls in classes:
-                item = QListWidgetItem(f"Class: {cls}")
-                item.setCheckState(Qt.Checked if cls in self.selected_items else Qt.Unchecked)
-                self.fileList.addItem(item)
+                self.addSymbolItem("Class", cls)
 
         for file_path, functions in self.all_functions.items():
             file_header = QListWidgetItem(f"File: {os.path.basename(file_path)} (Functions)")
             file_header.setFlags(file_header.flags() & ~Qt.ItemIsSelectable)
             self.fileList.addItem(file_header)
             for func in functions:
-                item = QListWidgetItem(f"Function: {func}")
-                item.setCheckState(Qt.Checked if func in self.selected_items else Qt.Unchecked)
-                self.fileList.addItem(item)
+                self.addSymbolItem("Function", func)
 
         layout.addWidget(self.fileList)
 
@@ -100,9 +111,16 @@ class SelectClassesFunctionsDialog(QDialog):
 
         self.setLayout(layout)
 
+    def addSymbolItem(self, kind, name):
+        item = QListWidgetItem(f"{kind}: {name}")
+        item.setData(Qt.UserRole, name)
+        item.setCheckState(Qt.Checked if name in self._preselected else Qt.Unchecked)
+        self.fileList.addItem(item)
+        self.checkableItems.append(item)
+
     def accept(self):
         self.selected_items = [
-            item.text().split(": ")[1] for item in self.fileList.findItems("*", Qt.MatchWildcard)
+            item.data(Qt.UserRole) for item in self.checkableItems
             if item.checkState() == Qt.Checked
         ]
         super().accept()
@@ -112,14 +130,21 @@ class SelectClassesFunctionsDialog(QDialog):
 
 
 class FilePicker(QWidget):
+    fileRendered = pyqtSignal(int)  # Emitted from worker threads with the render generation
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle('FileKitty')
-        self.setWindowIcon(QIcon(ICON_PATH))
+        self.setWindowIcon(app_icon())
         self.setGeometry(100, 100, 800, 600)
         self.setAcceptDrops(True)  # Enable drag-and-drop
         self.selected_items = []  # Track selected items
         self.currentFiles = []  # Track current files
+        self.pythonFiles = []  # Subset of currentFiles that are Python sources
+        self.renderGeneration = 0  # Bumped per render so results for an older selection are dropped
+        self.pendingRenders = []  # (file_path, future) for each file of the latest render, in file order
+        self.rendersRemaining = 0
+        self.settings = app_settings()
         self.initUI()
         self.createActions()
         self.createMenu()
@@ -156,6 +181,13 @@ class FilePicker(QWidget):
 
         self.textEdit.textChanged.connect(self.updateCopyButtonState)
 
+        # Coalesces back-to-back render requests into a single updateTextEdit call
+        self.renderTimer = QTimer(self)
+        self.renderTimer.setSingleShot(True)
+        self.renderTimer.setInterval(30)
+        self.renderTimer.timeout.connect(self.updateTextEdit)
+        self.fileRendered.connect(self.onFileRendered, Qt.QueuedConnection)
+
         self.setLayout(layout)
 
     def createActions(self):
@@ -177,12 +209,10 @@ class FilePicker(QWidget):
             self.set_default_path(new_path)
 
     def get_default_path(self):
-        settings = QSettings('YourCompany', 'FileKitty')
-        return settings.value('defaultPath', '')
+        return self.settings.value('defaultPath', '')
 
     def set_default_path(self, path):
-        settings = QSettings('YourCompany', 'FileKitty')
-        settings.setValue('defaultPath', path)
+        self.settings.setValue('defaultPath', path)
 
     def openFiles(self):
         default_path = self.get_default_path() or ""
@@ -193,83 +223,96 @@ class FilePicker(QWidget):
             options=options
         )
         if files:
-            self.currentFiles = files
-            self.fileList.clear()
-            for file in files:
-                sanitized_path = self.sanitize_path(file)
-                self.fileList.addItem(sanitized_path)
+            self.loadFiles(files)
+
+    def loadFiles(self, files):
+        """Replace the current file selection and refresh the UI."""
+        self.currentFiles = files
+        self.pythonFiles = []
+        sanitized_paths = []
+        for file in files:
+            sanitized_paths.append(self.sanitize_path(file))
+            if file.endswith('.py'):
+                self.pythonFiles.append(file)
 
-            if all(file.endswith('.py') for file in files):
-                self.btnSelectClassesFunctions.setEnabled(True)
-            else:
-                self.btnSelectClassesFunctions.setEnabled(False)
+        self.fileList.clear()
+        self.fileList.addItems(sanitized_paths)
 
-            self.updateTextEdit()
+        self.btnSelectClassesFunctions.setEnabled(len(self.pythonFiles) == len(files))
+
+        self.scheduleTextUpdate()
 
     def selectClassesFunctions(self):
         """Allow selection of classes/functions from all selected Python files."""
         all_classes = {}
         all_functions = {}
-        for file_path in self.currentFiles:
-            if file_path.endswith('.py'):
-                classes, functions, _, _ = parse_python_file(file_path)
-                all_classes[file_path] = classes
-                all_functions[file_path] = functions
+        # File reads overlap on the worker pool, but this still blocks until every file is parsed
+        for file_path, (classes, functions, _, _, _) in zip(
+                self.pythonFiles, file_pool().map(parse_python_file, self.pythonFiles)):
+            all_classes[file_path] = classes
+            all_functions[file_path] = functions
 
         if all_classes or all_functions:
             dialog = SelectClassesFunctionsDialog(all_classes, all_functions, self.selected_items, self)
             if dialog.exec_():
                 self.selected_items = dialog.get_selected_items()
-                self.updateTextEdit()
+                self.scheduleTextUpdate()
+
+    def scheduleTextUpdate(self):
+        """Request a re-render; requests arriving before the timer fires share one render."""
+        self.renderTimer.start()
 
     def copyToClipboard(self):
         clipboard = QGuiApplication.clipboard()
         clipboard.setText(self.textEdit.toPlainText())
 
     def updateCopyButtonState(self):
-        text = self.textEdit.toPlainText()
-        line_count = text.count('\n') + 1 if text else 0
+        document = self.textEdit.document()
+        has_text = not document.isEmpty()
+        line_count = document.blockCount() if has_text else 0
         self.lineCountLabel.setText(f'Lines ready to copy: {line_count}')
-        self.btnCopy.setEnabled(bool(text))
+        self.btnCopy.setEnabled(has_text and not self.rendersRemaining)
 
     def sanitize_path(self, file_path):
         """Remove sensitive directory information from file paths."""
-        parts = file_path.split(os.sep)
-        if "Users" in parts:
-            user_index = parts.index("Users")
-            # Remove the "Users" directory and the one immediately following it (likely the username)
-            sanitized_parts = parts[:user_index] + parts[user_index + 2:]
-            return os.sep.join(sanitized_parts)
-        return file_path
+        return sanitize_path(file_path)
 
     def updateTextEdit(self):
-        """Update the main text area with the content of all selected files."""
-        combined_code = ""
-        for file_path in self.currentFiles:
-            sanitized_path = self.sanitize_path(file_path)
-            if file_path.endswith('.py'):
-                classes, functions, imports, file_content = parse_python_file(file_path)
-                if not self.selected_items:
-                    combined_code += f"# {sanitized_path}\n\n```python\n{file_content}\n```\n"
-                else:
-                    filtered_code = extract_code_and_imports(file_content, self.selected_items, sanitized_path)
-                    if filtered_code.strip():
-                        combined_code += filtered_code
-            else:
-                with open(file_path, 'r', encoding='utf-8') as file:
-                    file_content = file.read()
-                    combined_code += f"# {sanitized_path}\n\n```{self.detect_language(file_path)}\n{file_content}\n```\n"
-
-        self.textEdit.setText(combined_code)
-
-    def detect_language(self, file_path):
-        """Detect the language based on the file extension for syntax highlighting in markdown."""
-        if file_path.endswith('.js'):
-            return 'javascript'
-        elif file_path.endswith(('.ts', '.tsx')):
-            return 'typescript'
-        else:
-            return 'plaintext'
+        """Start rendering all selected files on the worker pool; onFileRendered fills the text area."""
+        for _, future in self.pendingRenders:
+            future.cancel()
+        self.renderGeneration += 1
+        generation = self.renderGeneration
+        render = functools.partial(render_file, selected_items=tuple(self.selected_items))
+        self.pendingRenders = [
+            (file_path, file_pool().submit(render, file_path)) for file_path in self.currentFiles
+        ]
+        self.rendersRemaining = len(self.pendingRenders)
+        if not self.pendingRenders:
+            self.textEdit.setPlainText("")
+            return
+        # The text area still shows the previous selection until this render completes
+        self.btnCopy.setEnabled(False)
+        self.lineCountLabel.setText('Loading files...')
+        for _, future in self.pendingRenders:
+            future.add_done_callback(lambda _, generation=generation: self.fileRendered.emit(generation))
+
+    def onFileRendered(self, generation):
+        """Count finished files of the current render and show the output once all are done."""
+        if generation != self.renderGeneration:
+            return
+        self.rendersRemaining -= 1
+        if self.rendersRemaining == 0:
+            combined_code = "".join(self.renderedText(file_path, future) for file_path, future in self.pendingRenders)
+            # Plain text, so HTML/XML files are never rendered as markup
+            self.textEdit.setPlainText(combined_code)
+
+    def renderedText(self, file_path, future):
+        """Return a finished render, or an error block if the file could not be read."""
+        try:
+            return future.result()
+        except Exception as e:
+            return f"# {sanitize_path(file_path)}\n\nError reading file: {e}\n"
 
     def dragEnterEvent(self, event: QDragEnterEvent):
         if event.mimeData().hasUrls():
@@ -282,92 +325,198 @@ class FilePicker(QWidget):
             files = []
             for url in event.mimeData().urls():
                 if url.isLocalFile():
-                    files.append(url.toLocalFile())
-            if files:
-                self.currentFiles = files
-                self.fileList.clear()
-                for file in files:
-                    sanitized_path = self.sanitize_path(file)
-                    self.fileList.addItem(sanitized_path)
-
-                if all(file.endswith('.py') for file in files):
-                    self.btnSelectClassesFunctions.setEnabled(True)
-                else:
-                    self.btnSelectClassesFunctions.setEnabled(False)
-
-                self.updateTextEdit()
+                    local_path = url.toLocalFile()
+                    # Skip directories and files that vanished mid-drop
+                    try:
+                        if stat.S_ISREG(os.stat(local_path).st_mode):
+                            files.append(local_path)
+                    except OSError:
+                        pass
             event.acceptProposedAction()
+            if files:
+                self.loadFiles(files)
         else:
             event.ignore()
 
 
 def parse_python_file(file_path):
+    """Parse a Python file, reusing the previous result while the file is unchanged."""
+    st = os.stat(file_path)
+    return _parse_python_file_cached(file_path, st.st_mtime_ns, st.st_size)
+
+
+@functools.lru_cache(maxsize=256)
+def _parse_python_file_cached(file_path, mtime_ns, size):
+    # mtime_ns and size are only part of the cache key, so an edited file is re-parsed
     try:
-        with open(file_path, 'r', encoding='utf-8') as file:
-            file_content = file.read()
-            tree = ast.parse(file_content, filename=file_path)
+        file_content = read_file_contents(file_path)
+        # Without these keywords there is nothing for ast to find; false positives just get parsed
+        if 'import' not in file_content and 'def' not in file_content and 'class' not in file_content:
+            return [], [], [], file_content, ()
+        tree = ast.parse(file_content, filename=file_path)
     except SyntaxError as e:
         print(f"Syntax error in file {file_path}: {e}")
-        return [], [], [], ""
+        return [], [], [], file_content, ()
 
     classes = []
     functions = []
     imports = []
+    definitions = []  # (name, lineno, end_lineno) of every class and function, in walk order
+    lines = file_content.split('\n')
 
-    for node in ast.walk(tree):
-        if isinstance(node, ast.ClassDef):
+    class_def, function_def, import_types = ast.ClassDef, ast.FunctionDef, (ast.Import, ast.ImportFrom)
+    for node in _walk_statements(tree):
+        node_type = type(node)
+        if node_type is class_def:
             classes.append(node.name)
-        elif isinstance(node, ast.FunctionDef):
+            definitions.append((node.name, node.lineno, node.end_lineno))
+        elif node_type is function_def:
             functions.append(node.name)
-        elif isinstance(node, (ast.Import, ast.ImportFrom)):
-            imports.append(ast.get_source_segment(file_content, node))
+            definitions.append((node.name, node.lineno, node.end_lineno))
+        elif node_type in import_types:
+            imports.append(_source_segment(lines, node))
+
+    # Only these derived spans are cached; the tree itself is ~30x the source size
+    return classes, functions, imports, file_content, tuple(definitions)
+
+
+@functools.lru_cache(maxsize=None)
+def app_icon():
+    """Return the application icon, decoding the PNG only on first use (after QApplication exists)."""
+    return QIcon(ICON_PATH)
+
+
+@functools.lru_cache(maxsize=None)
+def file_pool():
+    """Return the shared workers that read, parse and render files."""
+    # Imported here so concurrent.futures (and its threading/queue imports) stay off the startup path
+    from concurrent.futures import ThreadPoolExecutor
+    return ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1))
+
 
-    return classes, functions, imports, file_content
+@functools.lru_cache(maxsize=None)
+def app_settings():
+    """Return the shared QSettings store; Qt keeps its values cached per instance."""
+    return QSettings('YourCompany', 'FileKitty')
 
 
+def render_file(file_path, selected_items):
+    """Return the markdown block for one file, or an empty string if none of its code is selected."""
+    sanitized_path = sanitize_path(file_path)
+    if not file_path.endswith('.py'):
+        file_content = read_file_contents(file_path)
+        return f"# {sanitized_path}\n\n```{detect_language(file_path)}\n{file_content}\n```\n"
+
+    st = os.stat(file_path)
+    if not selected_items:
+        file_content = _parse_python_file_cached(file_path, st.st_mtime_ns, st.st_size)[3]
+        return f"# {sanitized_path}\n\n```python\n{file_content}\n```\n"
+    return _render_selection_cached(file_path, st.st_mtime_ns, st.st_size, tuple(selected_items))
+
+
+@functools.lru_cache(maxsize=256)
+def _render_selection_cached(file_path, mtime_ns, size, selected_items):
+    # Only filtered renders are cached: they are small and derived from the cached parse
+    classes, functions, imports, file_content, definitions = _parse_python_file_cached(file_path, mtime_ns, size)
+    return extract_code_and_imports(file_content, selected_items, sanitize_path(file_path), definitions, imports)
+
+
+def detect_language(file_path):
+    """Detect the language based on the file extension for syntax highlighting in markdown."""
+    return LANGUAGES_BY_EXTENSION.get(os.path.splitext(file_path)[1], 'plaintext')
+
+
+def read_file_contents(file_path):
+    """Read a text file with a single binary read, decoding as UTF-8 with a latin-1 fallback."""
+    with open(file_path, 'rb') as file:
+        data = file.read()
+    try:
+        text = data.decode('utf-8')
+    except UnicodeDecodeError:
+        text = data.decode('latin-1')
+    # Normalize line endings the way text-mode open() would
+    if '\r' in text:
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    return text
+
+
+@functools.lru_cache(maxsize=4096)
 def sanitize_path(file_path):
     """Remove sensitive directory information from file paths."""
+    if "Users" not in file_path:
+        return file_path
     parts = file_path.split(os.sep)
-    if "Users" in parts:
+    try:
         user_index = parts.index("Users")
-        # Remove the "Users" directory and the one immediately following it (likely the username)
-        sanitized_parts = parts[:user_index] + parts[user_index + 2:]
-        return os.sep.join(sanitized_parts)
-    return file_path
+    except ValueError:
+        return file_path
+    # Remove the "Users" directory and the one immediately following it (likely the username)
+    sanitized_parts = parts[:user_index] + parts[user_index + 2:]
+    return os.sep.join(sanitized_parts)
 
 
-def extract_code_and_imports(file_content, selected_items, sanitized_path):
-    tree = ast.parse(file_content)
+def extract_code_and_imports(file_content, selected_items, sanitized_path, definitions, imports):
+    """Render the selected definitions of one file from the spans and imports found by parse_python_file."""
+    selected_names = set(selected_items)
     selected_code = []
-    imports = set()
-
-    for node in ast.walk(tree):
-        if isinstance(node, (ast.Import, ast.ImportFrom)):
-            imports.add(ast.get_source_segment(file_content, node))
+    lines = file_content.split('\n')
 
-    imports_str = "\n".join(sorted(imports))
-    header = f"# {sanitized_path}\n\n## Selected Classes/Functions: {', '.join(selected_items)}\n"
-
-    for node in ast.walk(tree):
-        if isinstance(node, (ast.ClassDef, ast.FunctionDef)) and node.name in selected_items:
-            start_line = node.lineno - 1
-            end_line = node.end_lineno
-            code_block = "\n".join(file_content.splitlines()[start_line:end_line])
-            reference_path = f"{sanitized_path.replace('/', '.')}.{node.name}"
+    for name, lineno, end_lineno in definitions:
+        if name in selected_names:
+            code_block = "\n".join(lines[lineno - 1:end_lineno])
+            reference_path = f"{sanitized_path.replace('/', '.')}.{name}"
             selected_code.append(f"### `{reference_path}`\n\n```python\n{code_block}\n```\n")
 
     if selected_code:
-        return f"{header}\n```python\n{imports_str}\n```\n\n" + "\n".join(selected_code)
+        imports_str = "\n".join(sorted(set(imports)))
+        header = f"# {sanitized_path}\n\n## Selected Classes/Functions: {', '.join(selected_items)}\n"
+        return "".join([header, "\n```python\n", imports_str, "\n```\n\n", "\n".join(selected_code)])
     else:
         # If no classes/functions are selected in this file, return an empty string
         return ""
 
 
+def _walk_statements(tree):
+    """Yield the statement-level nodes of tree in the same order as ast.walk.
+
+    Classes, functions and imports can only appear in statement lists, so expression
+    subtrees (calls, names, literals...), which make up most of a module, are never entered.
+    """
+    todo = deque([tree])
+    while todo:
+        node = todo.popleft()
+        # Field order matches node._fields, which keeps the traversal identical to ast.walk
+        for field in _STATEMENT_FIELDS:
+            children = getattr(node, field, None)
+            if type(children) is list:
+                todo.extend(children)
+        yield node
+
+
+def _source_segment(lines, node):
+    """Same result as ast.get_source_segment, sliced from lines the caller split once."""
+    first, last = node.lineno - 1, node.end_lineno - 1
+    if first == last:
+        return _slice_columns(lines[first], node.col_offset, node.end_col_offset)
+    return '\n'.join([
+        _slice_columns(lines[first], node.col_offset, None),
+        *lines[first + 1:last],
+        _slice_columns(lines[last], 0, node.end_col_offset),
+    ])
+
+
+def _slice_columns(line, start, end):
+    # AST column offsets count UTF-8 bytes, which only match str indices on ASCII lines
+    if line.isascii():
+        return line[start:end]
+    return line.encode('utf-8')[start:end].decode('utf-8')
+
+
 if __name__ == '__main__':
     app = QApplication([])
     app.setOrganizationName('YourCompany')
     app.setApplicationName('FileKitty')
-    app.setWindowIcon(QIcon(ICON_PATH))
+    app.setWindowIcon(app_icon())
     ex = FilePicker()
     ex.show()
     app.exec_()